@@ -33,6 +33,12 @@ class TrainRestController(
     // now hold mutable lists so we can append new DataPoints
     private val metrics = ConcurrentHashMap<String, MutableList<LogSchema>>()
 
+    // profiling summary reported by train.py at the end of a profiled job
+    private val profiles = ConcurrentHashMap<String, Map<String, Any>>()
+
+    // hyperparameter sweep summary reported by train.py when a sweep finishes
+    private val sweeps = ConcurrentHashMap<String, Map<String, Any>>()
+
     override fun trainUploadData(deploymentId: String, file: Resource?): ResponseEntity<Unit> {
         storage.saveData(Storage.StorageType.TRAIN, deploymentId, file!!)
         return ResponseEntity.ok().build()
@@ -42,6 +48,16 @@ class TrainRestController(
         deploymentId: String,
         trainStartRequest: TrainStartRequest
     ): ResponseEntity<Unit> {
+        // warm start source must be a known deployment id, never a path
+        val initFrom = trainStartRequest.initFrom
+        if (initFrom != null &&
+            (initFrom.isBlank() || initFrom.contains('/') || initFrom.contains('\\') || initFrom.contains("..") ||
+                deploymentRegistry.get(initFrom) == null)
+        ) {
+            logger.warn("Rejecting training for {}: invalid init_from {}", deploymentId, initFrom)
+            return ResponseEntity.status(HttpStatus.BAD_REQUEST).build()
+        }
+
         // ensure data is uploaded
         val zipPath = storage.getDataPath(Storage.StorageType.TRAIN, deploymentId)
 
@@ -71,14 +87,25 @@ class TrainRestController(
 
         // initialize empty, thread-safe lists for metrics
         metrics[deploymentId] = CopyOnWriteArrayList()
+        profiles.remove(deploymentId)
+        sweeps.remove(deploymentId)
 
-        val processBuilder = ProcessBuilder(
+        val command = mutableListOf(
             "venv/bin/python", "-u",
             "train.py",
             "--config", "classification.yaml",//"${type.path}.yaml",
             "--data_path", "data/datasets/$deploymentId",
             "--deployment_id", deploymentId
-        ).directory(File("../model_zoo"))
+        )
+        if (trainStartRequest.profile == true) {
+            command += listOf("--profile", "1")
+        }
+        initFrom?.let { command += listOf("--init_from", it) }
+        trainStartRequest.replayRatio?.let { command += listOf("--replay_ratio", it.toString()) }
+        if (trainStartRequest.sweep == true) {
+            command += listOf("--sweep", "1")
+        }
+        val processBuilder = ProcessBuilder(command).directory(File("../model_zoo"))
 
         logger.info("Running ${processBuilder.command().joinToString(" ")}")
 
@@ -98,6 +125,14 @@ class TrainRestController(
                             val entry = objectMapper.readValue(json, LogSchema::class.java)
                             metrics[deploymentId]!!.add(entry)
                             logger.info("LOGGING POINT: {}", entry)
+                        } else if (line!!.startsWith("profile:")) {
+                            val json = line!!.removePrefix("profile:")
+                            @Suppress("UNCHECKED_CAST")
+                            profiles[deploymentId] = objectMapper.readValue(json, Map::class.java) as Map<String, Any>
+                        } else if (line!!.startsWith("sweep:")) {
+                            val json = line!!.removePrefix("sweep:")
+                            @Suppress("UNCHECKED_CAST")
+                            sweeps[deploymentId] = objectMapper.readValue(json, Map::class.java) as Map<String, Any>
                         }
                     }
                 }
@@ -134,7 +169,9 @@ class TrainRestController(
                 valLoss,
                 trainLoss,
                 valAcc,
-                trainAcc
+                trainAcc,
+                profile = profiles[deploymentId],
+                sweep = sweeps[deploymentId]
             )
         )
     }
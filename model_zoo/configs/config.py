@@ -28,7 +28,11 @@ def get_cfg(
         use_wandb,
         checkpoint_name,
         dataset_path,
-        inference_mode=False
+        inference_mode=False,
+        profile=None,
+        init_from=None,
+        replay_ratio=None,
+        sweep=None
     ):
     """
     Define configuration.
@@ -47,6 +51,10 @@ def get_cfg(
     _cfg.WANDB.USE_WANDB = use_wandb if use_wandb is not None else _cfg.WANDB.USE_WANDB
     _cfg.DATASET.DATASET_PATH = dataset_path if dataset_path is not None else _cfg.DATASET.DATASET_PATH
     _cfg.EVAL_ONLY = inference_mode
+    _cfg.PROFILE.ENABLED = profile if profile is not None else _cfg.PROFILE.ENABLED
+    _cfg.FINETUNE.INIT_FROM = init_from if init_from is not None else _cfg.FINETUNE.INIT_FROM
+    _cfg.FINETUNE.REPLAY_RATIO = replay_ratio if replay_ratio is not None else _cfg.FINETUNE.REPLAY_RATIO
+    _cfg.SWEEP.ENABLED = sweep if sweep is not None else _cfg.SWEEP.ENABLED
     if use_wandb:
         _cfg.WANDB.WANDB_ID = _cfg.MODEL.UUID
 
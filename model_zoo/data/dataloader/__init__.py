@@ -2,10 +2,13 @@ import os
 from torch.utils.data import Dataset
 from torchvision import transforms
 
+from .large_image import IMAGE_EXTS, open_image
+
 class BaseDataset(Dataset):
-    def __init__(self, data_root_dir, transform=None, inference=False):
+    def __init__(self, data_root_dir, transform=None, inference=False, image_size=224):
         self.data_root_dir = data_root_dir
-        self.transform = transform if transform else self._base_reshape(img_shape=224)
+        self.image_size = image_size
+        self.transform = transform if transform else self._base_reshape(img_shape=image_size)
         self.samples = self._scan_files()
         self.inference = inference
         print(f"Found {len(self.samples)} samples in {data_root_dir}")
@@ -14,7 +17,7 @@ class BaseDataset(Dataset):
         return sorted([
             os.path.join(self.data_root_dir, fname)
             for fname in os.listdir(self.data_root_dir)
-            if fname.lower().endswith(('.png', '.jpg', '.jpeg'))
+            if fname.lower().endswith(IMAGE_EXTS)
         ])
 
     def _base_reshape(self, img_shape=224):
@@ -30,6 +33,10 @@ class BaseDataset(Dataset):
     def reshape(self, new_transform):
         self.transform = new_transform
 
+    def _load_image(self, img_path):
+        '''Opens an image as RGB, decoding large TIFF/DICOM files lazily at reduced resolution'''
+        return open_image(img_path, self.image_size)
+
     def __getitem__(self, idx):
         raise NotImplementedError("Use a child class like SegmentationDataset, etc.")
 
@@ -53,7 +60,7 @@ def load_dataset(model_type):
         raise ValueError(f"Unknown model type: {model_type}")
 
     
-def load_dataset_instance(model_type, data_root_dir, transform=None, inference=False, class_to_idx=None):
+def load_dataset_instance(model_type, data_root_dir, transform=None, inference=False, class_to_idx=None, image_size=224):
     dataset_class = load_dataset(model_type)
     dataset_kwargs = {
         'data_root_dir': data_root_dir,
@@ -63,7 +70,8 @@ def load_dataset_instance(model_type, data_root_dir, transform=None, inference=F
         dataset_kwargs['bbox_json_path'] = os.path.join(data_root_dir, 'bbox.json')
     
     if model_type == 'classification':
-        return dataset_class(data_root_dir=data_root_dir, transform=transform, inference=inference, class_to_idx=class_to_idx)
+        return dataset_class(data_root_dir=data_root_dir, transform=transform, inference=inference, class_to_idx=class_to_idx,
+                             image_size=image_size)
 
     else:
         return dataset_class(data_root_dir=data_root_dir, transform=transform, inference=inference,)
\ No newline at end of file
@@ -0,0 +1,161 @@
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class BatchAugmentation(nn.Module):
+    '''Augments whole collated batches on the device they already live on.
+
+    Flips, rotation and random resized crop are folded into a single affine grid per
+    batch, intensity jitter is a per-sample scale/shift, and mixup/cutmix mix the batch
+    with a shuffled copy of itself. uint8 batches (see CachedDataset) are converted to
+    float in [0, 1] first. In eval mode only that conversion is applied.
+
+    Args:
+        num_classes (int): number of classes, used to build soft targets for mixup/cutmix
+        hflip_p (float): probability of a horizontal flip per sample
+        vflip_p (float): probability of a vertical flip per sample
+        rotation_degrees (float): rotations are sampled uniformly in [-deg, deg]
+        brightness (float): brightness factor sampled in [1 - b, 1 + b]
+        contrast (float): contrast factor sampled in [1 - c, 1 + c]
+        crop_scale (tuple): (min, max) fraction of the image area kept by the random resized crop
+        crop_ratio (tuple): (min, max) aspect ratio of the random resized crop
+        mixup_alpha (float): Beta(alpha, alpha) parameter for mixup, 0 => disabled
+        cutmix_alpha (float): Beta(alpha, alpha) parameter for cutmix, 0 => disabled
+        mix_prob (float): probability of applying mixup/cutmix to a batch
+    '''
+    def __init__(self, num_classes=None, hflip_p=0.5, vflip_p=0.0, rotation_degrees=0.0,
+                 brightness=0.0, contrast=0.0, crop_scale=(1.0, 1.0), crop_ratio=(1.0, 1.0),
+                 mixup_alpha=0.0, cutmix_alpha=0.0, mix_prob=1.0):
+        super().__init__()
+        self.num_classes = num_classes
+        self.hflip_p = hflip_p
+        self.vflip_p = vflip_p
+        self.rotation_degrees = rotation_degrees
+        self.brightness = brightness
+        self.contrast = contrast
+        self.crop_scale = tuple(crop_scale)
+        self.crop_ratio = tuple(crop_ratio)
+        self.mixup_alpha = mixup_alpha
+        self.cutmix_alpha = cutmix_alpha
+        self.mix_prob = mix_prob
+
+    @staticmethod
+    def to_float(images):
+        '''Converts a uint8 batch to float in [0, 1]; float batches are returned unchanged'''
+        if images.dtype == torch.uint8:
+            return images.float().div_(255)
+        return images
+
+    def _uniform(self, low, high, n, device):
+        return torch.empty(n, device=device).uniform_(low, high)
+
+    def _geometric(self, images):
+        b = images.size(0)
+        device = images.device
+        use_crop = self.crop_scale != (1.0, 1.0)
+        if self.hflip_p <= 0 and self.vflip_p <= 0 and self.rotation_degrees <= 0 and not use_crop:
+            return images
+
+        # Output -> input coordinates in the [-1, 1] space used by affine_grid
+        sx = torch.ones(b, device=device)
+        sy = torch.ones(b, device=device)
+        tx = torch.zeros(b, device=device)
+        ty = torch.zeros(b, device=device)
+        if use_crop:
+            area = self._uniform(self.crop_scale[0], self.crop_scale[1], b, device)
+            log_ratio = self._uniform(math.log(self.crop_ratio[0]), math.log(self.crop_ratio[1]), b, device)
+            ratio = torch.exp(log_ratio)
+            sx = torch.sqrt(area * ratio).clamp(max=1.0)
+            sy = torch.sqrt(area / ratio).clamp(max=1.0)
+            tx = (torch.rand(b, device=device) * 2 - 1) * (1 - sx)
+            ty = (torch.rand(b, device=device) * 2 - 1) * (1 - sy)
+        if self.hflip_p > 0:
+            sx = torch.where(torch.rand(b, device=device) < self.hflip_p, -sx, sx)
+        if self.vflip_p > 0:
+            sy = torch.where(torch.rand(b, device=device) < self.vflip_p, -sy, sy)
+
+        angle = torch.zeros(b, device=device)
+        if self.rotation_degrees > 0:
+            angle = self._uniform(-self.rotation_degrees, self.rotation_degrees, b, device) * math.pi / 180
+        cos, sin = torch.cos(angle), torch.sin(angle)
+
+        theta = torch.stack([
+            torch.stack([sx * cos, -sy * sin, tx], dim=1),
+            torch.stack([sx * sin, sy * cos, ty], dim=1),
+        ], dim=1)
+        grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+        return F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+    def _intensity(self, images):
+        b = images.size(0)
+        device = images.device
+        if self.brightness > 0:
+            factor = self._uniform(1 - self.brightness, 1 + self.brightness, b, device)
+            images = images * factor.view(b, 1, 1, 1)
+        if self.contrast > 0:
+            factor = self._uniform(1 - self.contrast, 1 + self.contrast, b, device).view(b, 1, 1, 1)
+            mean = images.mean(dim=(1, 2, 3), keepdim=True)
+            images = (images - mean) * factor + mean
+        if self.brightness > 0 or self.contrast > 0:
+            images = images.clamp(0, 1)
+        return images
+
+    def _mix(self, images, targets):
+        use_mixup = self.mixup_alpha > 0
+        use_cutmix = self.cutmix_alpha > 0
+        if targets is None or not (use_mixup or use_cutmix) or torch.rand(1).item() >= self.mix_prob:
+            return images, targets
+
+        targets = targets.view(-1)
+        soft_targets = F.one_hot(targets, self.num_classes).to(images.dtype)
+        perm = torch.randperm(images.size(0), device=images.device)
+
+        if use_cutmix and (not use_mixup or torch.rand(1).item() < 0.5):
+            lam = torch.distributions.Beta(self.cutmix_alpha, self.cutmix_alpha).sample().item()
+            h, w = images.shape[-2:]
+            cut_h, cut_w = int(h * math.sqrt(1 - lam)), int(w * math.sqrt(1 - lam))
+            cy, cx = torch.randint(h, (1,)).item(), torch.randint(w, (1,)).item()
+            y1, y2 = max(cy - cut_h // 2, 0), min(cy + cut_h // 2, h)
+            x1, x2 = max(cx - cut_w // 2, 0), min(cx + cut_w // 2, w)
+            images = images.clone()
+            images[:, :, y1:y2, x1:x2] = images[perm, :, y1:y2, x1:x2]
+            # Correct lambda for the part of the box clipped at the border
+            lam = 1 - (y2 - y1) * (x2 - x1) / (h * w)
+        else:
+            lam = torch.distributions.Beta(self.mixup_alpha, self.mixup_alpha).sample().item()
+            images = lam * images + (1 - lam) * images[perm]
+
+        soft_targets = lam * soft_targets + (1 - lam) * soft_targets[perm]
+        return images, soft_targets
+
+    def forward(self, images, targets=None):
+        images = self.to_float(images)
+        if not self.training:
+            return images, targets
+        with torch.no_grad():
+            images = self._geometric(images)
+            images = self._intensity(images)
+            images, targets = self._mix(images, targets)
+        return images, targets
+
+
+def build_batch_augmentation(config, num_classes=None):
+    '''Builds a BatchAugmentation from the AUGMENTATION section of the config, or None when disabled'''
+    aug_cfg = config.get('AUGMENTATION', None)
+    if aug_cfg is None or not aug_cfg.ENABLED:
+        return None
+    return BatchAugmentation(
+        num_classes=num_classes,
+        hflip_p=aug_cfg.HFLIP_P,
+        vflip_p=aug_cfg.VFLIP_P,
+        rotation_degrees=aug_cfg.ROTATION_DEGREES,
+        brightness=aug_cfg.BRIGHTNESS,
+        contrast=aug_cfg.CONTRAST,
+        crop_scale=aug_cfg.CROP_SCALE,
+        crop_ratio=aug_cfg.CROP_RATIO,
+        mixup_alpha=aug_cfg.MIXUP_ALPHA,
+        cutmix_alpha=aug_cfg.CUTMIX_ALPHA,
+        mix_prob=aug_cfg.MIX_PROB,
+    )
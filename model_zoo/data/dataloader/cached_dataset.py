@@ -0,0 +1,76 @@
+import os
+import hashlib
+import torch
+from torch.utils.data import Dataset
+
+
+def get_cache_path(cache_dir, data_root_dir):
+    '''Returns the cache file of a dataset split, kept outside the (user uploaded) dataset directory
+
+    The file name is derived from the split's absolute path, so every run and sweep trial
+    on the same data shares it.
+    '''
+    key = hashlib.sha1(os.path.realpath(data_root_dir).encode('utf-8')).hexdigest()[:16]
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, f'{key}.cache.pt')
+
+
+class CachedDataset(Dataset):
+    '''Decodes a labelled dataset once and keeps it in memory as a uint8 tensor store.
+
+    Every sample of `dataset` is decoded through its own transform, quantized to uint8
+    and stacked into a single (N, C, H, W) tensor, so later epochs skip PIL entirely.
+    Batches come out as uint8 and are turned back into floats by BatchAugmentation on
+    the target device. When `cache_path` is given the store is saved there and reused
+    by later runs on the same dataset; it is memory-mapped on load so concurrent sweep
+    trials share the same pages. A saved store is only reused when its fingerprint
+    (sample paths with size/mtime, image size and class mapping) still matches.
+
+    Args:
+        dataset (Dataset): dataset returning (image in [0, 1], label) pairs
+        cache_path (str): optional file the decoded store is saved to / loaded from
+    '''
+    def __init__(self, dataset, cache_path=None):
+        self.cache_path = cache_path
+        fingerprint = self._fingerprint(dataset)
+        if cache_path is not None and os.path.exists(cache_path):
+            store = torch.load(cache_path, mmap=True, weights_only=True)
+            if store.get('fingerprint') == fingerprint:
+                print(f"[INFO] Loaded decoded dataset cache: {cache_path}")
+                self.images, self.labels = store['images'], store['labels']
+                return
+            print(f"[INFO] Dataset cache is stale, rebuilding: {cache_path}")
+
+        images, labels = [], []
+        for i in range(len(dataset)):
+            image, label = dataset[i]
+            images.append(image.mul(255).round_().to(torch.uint8))
+            labels.append(label)
+        self.images = torch.stack(images)
+        self.labels = torch.stack(labels)
+        print(f"[INFO] Decoded {len(self.labels)} samples into a {self.images.nbytes / 1024 ** 2:.1f} MB uint8 cache")
+
+        if cache_path is not None:
+            torch.save({'images': self.images, 'labels': self.labels, 'fingerprint': fingerprint}, cache_path)
+            print(f"[INFO] Dataset cache saved: {cache_path}")
+
+    @staticmethod
+    def _fingerprint(dataset):
+        '''Describes what the decoded store depends on: the files, their labels and the decode size'''
+        files = []
+        for path in dataset.samples:
+            stat = os.stat(path)
+            # The path relative to the root includes the class folder, i.e. the label
+            files.append((os.path.relpath(path, dataset.data_root_dir), stat.st_size, stat.st_mtime_ns))
+        return {
+            'files': files,
+            'image_size': getattr(dataset, 'image_size', None),
+            'class_to_idx': getattr(dataset, 'class_to_idx', None),
+        }
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return self.images[idx], self.labels[idx]
@@ -1,13 +1,12 @@
 import json
-from PIL import Image
 import torch
 import os
 
-from data.dataloader import BaseDataset
+from data.dataloader import BaseDataset, IMAGE_EXTS
 
 class ClassificationDataset(BaseDataset):
-    def __init__(self, data_root_dir, transform=None, inference=False, class_to_idx=None):
-        super().__init__(data_root_dir, transform, inference)
+    def __init__(self, data_root_dir, transform=None, inference=False, class_to_idx=None, image_size=224):
+        super().__init__(data_root_dir, transform, inference, image_size)
         if class_to_idx is not None:
             self.class_to_idx = class_to_idx
         else:
@@ -21,17 +20,16 @@ class ClassificationDataset(BaseDataset):
 
     # Override 
     def _scan_files(self):
-        image_exts = ('.png', '.jpg', '.jpeg')
         all_files = []
         for root, _, files in os.walk(self.data_root_dir):
             for fname in files:
-                if fname.lower().endswith(image_exts):
+                if fname.lower().endswith(IMAGE_EXTS):
                     all_files.append(os.path.join(root, fname))
         return sorted(all_files)        
         
     def __getitem__(self, idx):
         img_path = self.samples[idx]
-        image = Image.open(img_path).convert("RGB")
+        image = self._load_image(img_path)
         image = self.transform(image)
         if not self.inference:
             label_name = os.path.basename(os.path.dirname(img_path))
@@ -0,0 +1,228 @@
+import os
+import numpy as np
+from PIL import Image
+
+STANDARD_EXTS = ('.png', '.jpg', '.jpeg')
+TIFF_EXTS = ('.tif', '.tiff')
+DICOM_EXTS = ('.dcm', '.dicom')
+IMAGE_EXTS = STANDARD_EXTS + TIFF_EXTS + DICOM_EXTS
+
+# Axes kept when reading a TIFF level; any other axis (Z, T, I, ...) is reduced to its middle index
+_KEPT_AXES = ('Y', 'X', 'S', 'C')
+
+# Tile size used to block-average arrays that are already in memory
+_IN_MEMORY_TILE = 1024
+
+
+def window_to_uint8(array, center=None, width=None):
+    '''Maps a high bit-depth array to uint8 through a [center - width/2, center + width/2] window.
+
+    Without an explicit window the 0.5 / 99.5 percentiles are used so a few hot pixels
+    do not wash out the whole image.
+    '''
+    array = array.astype(np.float32)
+    if center is None or width is None:
+        low, high = np.percentile(array, (0.5, 99.5))
+    else:
+        low, high = center - width / 2, center + width / 2
+    if high <= low:
+        high = low + 1
+    array = (np.clip(array, low, high) - low) / (high - low)
+    return (array * 255).astype(np.uint8)
+
+
+def _array_to_rgb(array):
+    '''Converts a (H, W) or (H, W, C) array of any dtype to a 3-channel PIL image'''
+    if array.ndim == 3 and array.shape[-1] == 1:
+        array = array[..., 0]
+    if array.ndim == 3:
+        array = array[..., :3]
+    if array.dtype != np.uint8:
+        array = window_to_uint8(array)
+    return Image.fromarray(array).convert('RGB')
+
+
+def _stride(height, width, target_size):
+    '''Largest subsampling step keeping the short side at least `target_size`'''
+    return max(1, min(height, width) // target_size)
+
+
+def _bin_edges(start, stop, step):
+    '''Local offsets in [start, stop) where a new output block of `step` pixels begins, and block sizes'''
+    first_block, last_block = start // step, (stop - 1) // step
+    edges = [0] + [block * step - start for block in range(first_block + 1, last_block + 1)]
+    sizes = np.diff(edges + [stop - start])
+    return edges, sizes
+
+
+def _block_mean(read_tile, height, width, tile_height, tile_width, step):
+    '''Area-averages an image over `step` x `step` blocks, reading it one tile at a time.
+
+    `read_tile(y0, y1, x0, x1)` returns the (Y, X[, C]) region; block sums are accumulated
+    per tile so only one tile and the reduced output are held in memory. Border blocks
+    that only partially fit are averaged over the pixels they cover.
+    '''
+    out_height, out_width = -(-height // step), -(-width // step)
+    total = None
+    count = np.zeros((out_height, out_width, 1), dtype=np.float64)
+    for y0 in range(0, height, tile_height):
+        y1 = min(y0 + tile_height, height)
+        row_edges, row_sizes = _bin_edges(y0, y1, step)
+        for x0 in range(0, width, tile_width):
+            x1 = min(x0 + tile_width, width)
+            col_edges, col_sizes = _bin_edges(x0, x1, step)
+            tile = np.asarray(read_tile(y0, y1, x0, x1), dtype=np.float64)
+            if tile.ndim == 2:
+                tile = tile[..., None]
+            if total is None:
+                total = np.zeros((out_height, out_width, tile.shape[-1]), dtype=np.float64)
+            sums = np.add.reduceat(np.add.reduceat(tile, row_edges, axis=0), col_edges, axis=1)
+            by, bx = y0 // step, x0 // step
+            total[by:by + sums.shape[0], bx:bx + sums.shape[1]] += sums
+            count[by:by + sums.shape[0], bx:bx + sums.shape[1], 0] += np.outer(row_sizes, col_sizes)
+    return total / count
+
+
+def _downsample(read_tile, height, width, tile_height, tile_width, target_size, dtype):
+    '''Block-averages to a short side of at least `target_size`, keeping uint8 data as uint8'''
+    step = _stride(height, width, target_size)
+    if step == 1:
+        array = np.asarray(read_tile(0, height, 0, width))
+    else:
+        array = _block_mean(read_tile, height, width, tile_height, tile_width, step)
+        if dtype == np.uint8:
+            array = np.round(array).astype(np.uint8)
+    if array.ndim == 3 and array.shape[-1] == 1:
+        array = array[..., 0]
+    return array
+
+
+def _open_tiff(path, target_size):
+    '''Reads a TIFF at reduced resolution with bounded memory.
+
+    The smallest pyramid level that still covers `target_size` is selected and
+    area-averaged down to about `target_size` while iterating over its zarr chunks,
+    so only one tile is decoded at a time. Every tile of the selected level is
+    decoded, so decode time only drops when the file carries a pyramid.
+    '''
+    try:
+        import tifffile
+    except ImportError:
+        raise ImportError("tifffile is required to read TIFF images: pip install tifffile zarr")
+
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        levels = series.levels if len(series.levels) > 0 else [series]
+
+        def _hw(level):
+            return level.shape[level.axes.index('Y')], level.shape[level.axes.index('X')]
+
+        level_index = 0
+        for i, candidate in enumerate(levels[1:], start=1):
+            if min(_hw(candidate)) >= target_size:
+                level_index = i
+        level = levels[level_index]
+
+        height, width = _hw(level)
+        y_axis, x_axis = level.axes.index('Y'), level.axes.index('X')
+        # Reorder the remaining axes to (Y, X, channels)
+        kept = [axis for axis in level.axes if axis in _KEPT_AXES]
+        order = [kept.index('Y'), kept.index('X')] + [i for i, axis in enumerate(kept) if axis not in ('Y', 'X')]
+
+        try:
+            import zarr
+            # An explicit level always yields a plain array, never the multiscale group
+            source = zarr.open(series.aszarr(level=level_index), mode='r')
+            tile_height, tile_width = source.chunks[y_axis], source.chunks[x_axis]
+        except ImportError:
+            # Without zarr the selected level is decoded in full before averaging
+            source = level.asarray()
+            tile_height = tile_width = _IN_MEMORY_TILE
+
+        def read_tile(y0, y1, x0, x1):
+            index = tuple(
+                slice(y0, y1) if axis == 'Y'
+                else slice(x0, x1) if axis == 'X'
+                else slice(None) if axis in _KEPT_AXES
+                else level.shape[i] // 2
+                for i, axis in enumerate(level.axes)
+            )
+            return np.transpose(np.asarray(source[index]), order)
+
+        array = _downsample(read_tile, height, width, tile_height, tile_width, target_size, level.dtype)
+    return _array_to_rgb(array)
+
+
+def _dicom_value(value):
+    '''Returns the first element of a multi-valued DICOM attribute as float'''
+    if value is None:
+        return None
+    try:
+        return float(value[0])
+    except TypeError:
+        return float(value)
+
+
+def _open_dicom(path, target_size):
+    '''Decodes the middle frame of a DICOM file and windows it to 3-channel uint8'''
+    try:
+        import pydicom
+    except ImportError:
+        raise ImportError("pydicom is required to read DICOM images: pip install pydicom")
+
+    ds = pydicom.dcmread(path, stop_before_pixels=True)
+    n_frames = int(getattr(ds, 'NumberOfFrames', 1) or 1)
+    frame = n_frames // 2
+    try:
+        # pydicom >= 3 decodes a single frame without materializing the whole stack
+        from pydicom.pixels import pixel_array
+        array = pixel_array(path, index=frame if n_frames > 1 else None)
+    except ImportError:
+        array = pydicom.dcmread(path).pixel_array
+        if n_frames > 1:
+            array = array[frame]
+
+    frame_array = array
+    array = _downsample(
+        lambda y0, y1, x0, x1: frame_array[y0:y1, x0:x1], array.shape[0], array.shape[1],
+        _IN_MEMORY_TILE, _IN_MEMORY_TILE, target_size, array.dtype)
+
+    if getattr(ds, 'SamplesPerPixel', 1) == 1:
+        array = array.astype(np.float32)
+        array = array * float(getattr(ds, 'RescaleSlope', 1)) + float(getattr(ds, 'RescaleIntercept', 0))
+        array = window_to_uint8(
+            array,
+            center=_dicom_value(getattr(ds, 'WindowCenter', None)),
+            width=_dicom_value(getattr(ds, 'WindowWidth', None)),
+        )
+        if getattr(ds, 'PhotometricInterpretation', '') == 'MONOCHROME1':
+            array = 255 - array
+    return _array_to_rgb(array)
+
+
+def _open_standard(path, target_size):
+    '''Opens PNG/JPEG images, letting PIL decode JPEGs directly at a reduced scale'''
+    image = Image.open(path)
+    if image.format == 'JPEG':
+        image.draft('RGB', (target_size, target_size))
+    if image.mode in ('I', 'I;16', 'I;16B', 'I;16L', 'F'):
+        return _array_to_rgb(np.asarray(image))
+    return image.convert('RGB')
+
+
+def open_image(path, target_size=224):
+    '''Opens an image as RGB PIL image whose short side is close to (but not below) `target_size`.
+
+    Large TIFFs and DICOM files are decoded lazily so memory stays bounded regardless of
+    the source resolution; 16-bit data is windowed to 8 bits.
+
+    Args:
+        path (str): image file path
+        target_size (int): resolution the image will be resized to afterwards
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TIFF_EXTS:
+        return _open_tiff(path, target_size)
+    if ext in DICOM_EXTS:
+        return _open_dicom(path, target_size)
+    return _open_standard(path, target_size)
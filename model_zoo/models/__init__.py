@@ -32,7 +32,8 @@ def load_model(config, inference_mode=False):
             components = name.split(".")
             for comp in components[:-1]:
                 parent = getattr(parent, comp)
-            setattr(parent, components[-1], LoRALinear(module))
+            setattr(parent, components[-1], LoRALinear(
+                module, r=config.LORA.R, alpha=config.LORA.ALPHA, dropout=config.LORA.DROPOUT))
 
         return model, unfreeze_keywords
 
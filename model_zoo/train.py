@@ -1,5 +1,11 @@
 import base64
 import os
+import json
+import math
+import queue
+import random
+import shutil
+from contextlib import redirect_stdout
 from io import BytesIO
 from pathlib import Path
 
@@ -8,15 +14,23 @@ import torch
 import argparse
 
 import schedulefree
-from PIL import Image
+import torch.multiprocessing as mp
 
 from models import load_model  # updated import
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Subset
 import torch.optim as optim
 
-from data.dataloader import load_dataset_instance
+from data.dataloader import load_dataset_instance, open_image
+from data.dataloader.augmentation import BatchAugmentation, build_batch_augmentation
+from data.dataloader.cached_dataset import CachedDataset, get_cache_path
 from train_utils.misc_tools import set_random_seed, create_directory_if_not_exists, count_param_numbers, save_checkpoint
+from train_utils.profiler import TrainProfiler
+from train_utils.warm_start import (
+    get_warm_start_checkpoint_path, load_warm_start_checkpoint, extend_class_to_idx, load_warm_start_weights, select_incremental_indices)
+from train_utils.sweep import (
+    METRIC_MODES, SuccessiveHalvingScheduler, sample_hyperparameters, apply_hyperparameters)
 from configs.config import get_cfg
+from yacs.config import CfgNode as CN
 from loss import get_loss_function
 
 
@@ -30,6 +44,10 @@ def parse_args():
     parser.add_argument('--deployment_id', type=str, default=None)
     parser.add_argument('--use_wandb', type=int, default=-1)
     parser.add_argument('--inference_mode', type=int, default=-1)
+    parser.add_argument('--profile', type=int, default=-1)
+    parser.add_argument('--init_from', type=str, default=None)
+    parser.add_argument('--replay_ratio', type=float, default=None)
+    parser.add_argument('--sweep', type=int, default=-1)
 
     args = parser.parse_args()
     print(args, end='\n\n')
@@ -44,14 +62,84 @@ def parse_args():
             "${ROOT_DIR}", 'checkpoints', 'lora_weights', args.deployment_id,),
         dataset_path=args.data_path,
         inference_mode=True if args.inference_mode > 0 else False,
+        profile=True if args.profile > 0 else None,
+        init_from=args.init_from,
+        replay_ratio=args.replay_ratio,
+        sweep=True if args.sweep > 0 else None,
     )
     print(f'[INFO] Config file: {config}')
     return config
 
-def train(config):
+def load_datasets(config):
+    '''Builds the train/val datasets, applying warm start, caching and incremental selection.
+
+    Sets config.MODEL.NUM_CLASSES for classification and returns
+    (train_dataset, val_dataset, num_classes, class_to_idx, train_files, warm_start).
+    '''
+    train_dir = os.path.join(config.DATASET.DATASET_PATH, 'train')
+
+    # Warm start: keep the class indices of the previous deployment and append new classes
+    warm_start = None
+    warm_class_to_idx = None
+    if config.FINETUNE.INIT_FROM:
+        warm_start = load_warm_start_checkpoint(config)
+        if warm_start.get('lora') is not None:
+            # The adapter shapes are fixed by the run being continued
+            config.defrost()
+            config.LORA.R = warm_start['lora']['R']
+            config.LORA.ALPHA = warm_start['lora']['ALPHA']
+            config.freeze()
+        if config.MODEL_NAME == 'classification':
+            warm_class_to_idx = extend_class_to_idx(warm_start['class_to_idx'], os.listdir(train_dir))
+
+    train_dataset_class = load_dataset_instance(config.MODEL_NAME, train_dir, class_to_idx=warm_class_to_idx,
+                                                image_size=config.DATASET.IMAGE_SIZE)
+    val_dataset_class = load_dataset_instance(config.MODEL_NAME, os.path.join(config.DATASET.DATASET_PATH, 'val'),
+                                              class_to_idx=warm_class_to_idx, image_size=config.DATASET.IMAGE_SIZE)
+    train_files = [os.path.relpath(path, train_dir) for path in train_dataset_class.samples]
+
+    num_classes = None
+    class_to_idx = None
+    if config.MODEL_NAME == 'classification':
+        num_classes = train_dataset_class.get_num_classes()
+        class_to_idx = train_dataset_class.class_to_idx
+        print('[INFO] Number of classes in dataset:', num_classes)
+        config.defrost()
+        config.MODEL.NUM_CLASSES = num_classes
+        config.freeze()
+
+    # Decode once into a uint8 store; batches are converted back to float on the device
+    if config.DATASET.CACHE:
+        train_dataset_class = CachedDataset(
+            train_dataset_class, get_cache_path(config.DATASET.CACHE_DIR, train_dir))
+        val_dataset_class = CachedDataset(
+            val_dataset_class, get_cache_path(config.DATASET.CACHE_DIR, val_dataset_class.data_root_dir))
+
+    # Incremental update: files added since the warm start run plus a replay sample of old ones
+    if warm_start is not None and config.FINETUNE.REPLAY_RATIO >= 0:
+        if warm_start.get('train_files') is None:
+            print("[WARNING] Warm start checkpoint has no file list, training on the full dataset")
+        else:
+            indices = select_incremental_indices(
+                train_files, warm_start['train_files'], config.FINETUNE.REPLAY_RATIO, seed=config.SEED)
+            train_dataset_class = Subset(train_dataset_class, indices)
+
+    return train_dataset_class, val_dataset_class, num_classes, class_to_idx, train_files, warm_start
+
+
+def train(config, epoch_callback=None, save_metric='val_loss', save_after_epochs=0):
+    '''Trains the model described by `config`.
+
+    `epoch_callback(epochs_trained, metrics)` is called after every epoch with the
+    validation metrics of that epoch; returning True stops training early.
+    The checkpoint is saved whenever `save_metric` (a key of METRIC_MODES) improves,
+    once at least `save_after_epochs` epochs have been trained.
+    Returns the best value of `save_metric` reached.
+    '''
+    save_mode = METRIC_MODES[save_metric]
     print(f"Running training...")
-    train_dataset_class = load_dataset_instance(config.MODEL_NAME, os.path.join(config.DATASET.DATASET_PATH, 'train'))
-    val_dataset_class = load_dataset_instance(config.MODEL_NAME, os.path.join(config.DATASET.DATASET_PATH, 'val'))
+    train_dataset_class, val_dataset_class, num_classes, class_to_idx, train_files, warm_start = \
+        load_datasets(config)
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     num_workers = 0
@@ -66,17 +154,13 @@ def train(config):
     val_loader = DataLoader(val_dataset_class, batch_size=1,
                             shuffle=False, **common_loader_params)
 
-    num_classes = None
-    class_to_idx = None
-    if config.MODEL_NAME == 'classification':
-        num_classes = train_dataset_class.get_num_classes()
-        class_to_idx = train_dataset_class.class_to_idx
-        print('[INFO] Number of classes in dataset:', num_classes)
-        config.defrost()
-        config.MODEL.NUM_CLASSES = num_classes
-        config.freeze()
+    augmentation = build_batch_augmentation(config, num_classes)
+    if augmentation is not None:
+        print('[INFO] Batch augmentation enabled:', config.AUGMENTATION)
 
     model = load_model(config, inference_mode=False)
+    if warm_start is not None:
+        load_warm_start_weights(model, warm_start['model'])
     model.to(device)
 
     print(f'[INFO] Number of batches in train_set: {len(train_loader)}')
@@ -113,7 +197,17 @@ def train(config):
     create_directory_if_not_exists(checkpoint_dir)
     checkpoint_path = os.path.join(checkpoint_dir, 'best_model.pth.tr')
 
-    best_val_loss = float('inf')
+    best_metric = float('inf') if save_mode == 'min' else float('-inf')
+
+    profiler = TrainProfiler(
+        enabled=config.PROFILE.ENABLED,
+        device=device,
+        cuda_sync=config.PROFILE.CUDA_SYNC,
+        trace_start=config.PROFILE.TRACE_START_STEP,
+        trace_end=config.PROFILE.TRACE_END_STEP,
+        trace_dir=os.path.join(config.PROFILE.TRACE_DIR, config.MODEL.UUID),
+    )
+    profiler.start()
 
     for epoch in range(config.START_EPOCH, config.EPOCH_NUMBER):
         print(f"[INFO] Epoch {epoch}")
@@ -128,11 +222,12 @@ def train(config):
         # VALIDATION PHASE
         model.eval()
         optimizer.eval()
-        with torch.no_grad():
+        with torch.no_grad(), profiler.phase('validation'):
             val_loss = 0
             for i, batch in enumerate(val_loader):
                 inputs, targets = batch
                 inputs, targets = inputs.to(device), targets.to(device)
+                inputs = BatchAugmentation.to_float(inputs)
 
                 outputs = model(x=inputs)
                 loss = val_loss_fn(outputs, targets)
@@ -152,33 +247,53 @@ def train(config):
                 val_accuracy = val_correct / val_total if val_total > 0 else 0.0
                 print(f"[VAL] Accuracy: {val_accuracy:.4f}")
 
-        # Save checkpoint if validation loss improved
-        if val_loss < best_val_loss:
-            best_val_loss = val_loss
-            save_checkpoint(model, checkpoint_path, num_classes, class_to_idx)
+        # Save checkpoint if the monitored validation metric improved
+        current_metric = float(val_loss) if save_metric == 'val_loss' else val_accuracy
+        improved = current_metric < best_metric if save_mode == 'min' else current_metric > best_metric
+        if improved and epoch - config.START_EPOCH >= save_after_epochs:
+            best_metric = current_metric
+            with profiler.phase('checkpoint_save'):
+                save_checkpoint(model, checkpoint_path, num_classes, class_to_idx, train_files,
+                                lora={'R': config.LORA.R, 'ALPHA': config.LORA.ALPHA})
             print(f"[INFO] Checkpoint saved: {checkpoint_path}")
 
         # TRAINING PHASE
         model.train()
         optimizer.train()
         total_loss = 0
-        for i, batch in enumerate(train_loader):
+        for i, batch in enumerate(profiler.timed_iter(train_loader)):
+            profiler.step_begin()
             inputs, targets = batch
-            inputs, targets = inputs.to(device), targets.to(device)
+            with profiler.phase('h2d'):
+                inputs, targets = inputs.to(device, non_blocking=True), targets.to(device, non_blocking=True)
 
-            outputs = model(x=inputs)
-            loss = train_loss_fn(outputs, targets)
+            with profiler.phase('augment'):
+                if augmentation is not None:
+                    inputs, targets = augmentation(inputs, targets)
+                else:
+                    inputs = BatchAugmentation.to_float(inputs)
 
-            optimizer.zero_grad()
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(
-                model.parameters(), max_norm=config.MAX_GRAD_NORM)
-            optimizer.step()
+            with profiler.phase('forward'):
+                outputs = model(x=inputs)
+                loss = train_loss_fn(outputs, targets)
+
+            with profiler.phase('backward'):
+                optimizer.zero_grad()
+                loss.backward()
+
+            with profiler.phase('optimizer_step'):
+                torch.nn.utils.clip_grad_norm_(
+                    model.parameters(), max_norm=config.MAX_GRAD_NORM)
+                optimizer.step()
             total_loss += loss.item()
+            profiler.step_end()
 
             # Calculate training accuracy for each batch
             if config.MODEL_NAME == 'classification':
                 _, predicted = torch.max(outputs, 1)
+                if targets.dim() > 1 and targets.size(-1) == num_classes:
+                    # mixup/cutmix soft targets: score against the dominant class
+                    targets = targets.argmax(dim=1)
                 targets = targets.view(-1)  # <- this line ensures correct shape
                 train_correct += (predicted == targets).sum().item()
                 train_total += targets.size(0)
@@ -208,6 +323,208 @@ def train(config):
             print("pipe:{\"epoch\":"+str(epoch)+",\"train_loss\":"+str(logged_train_loss)+
                   ",\"val_loss\":"+str(logged_val_loss)+"}")
 
+        profiler.epoch_end()
+
+        if epoch_callback is not None:
+            val_metrics = {'val_loss': float(val_loss)}
+            if config.MODEL_NAME == 'classification':
+                val_metrics['val_acc'] = val_accuracy
+            # validation runs before training, so these metrics are for (epoch - START_EPOCH) epochs
+            if epoch_callback(epoch - config.START_EPOCH, val_metrics):
+                print(f"[INFO] Training stopped early after epoch {epoch}")
+                break
+
+    profiler.report()
+    return best_metric
+
+
+def _sweep_trial_worker(trial_id, config, report_queue, reply_queue, log_path, num_threads, rank_after_epochs):
+    '''Runs one sweep trial in a child process, reporting every epoch to the sweep scheduler'''
+    torch.set_num_threads(num_threads)
+    set_random_seed(config.SEED)
+
+    def epoch_callback(epochs_trained, metrics):
+        report_queue.put(('report', trial_id, epochs_trained, metrics))
+        return reply_queue.get()
+
+    with open(log_path, 'w') as log, redirect_stdout(log):
+        try:
+            train(config, epoch_callback=epoch_callback,
+                  save_metric=config.SWEEP.METRIC, save_after_epochs=rank_after_epochs)
+            # train() may adjust the config (e.g. class count), send back what was actually used
+            report_queue.put(('done', trial_id, config.dump()))
+        except Exception as e:
+            print(f"[ERROR] Trial failed: {e!r}")
+            report_queue.put(('failed', trial_id))
+
+
+def sweep(config):
+    '''Hyperparameter sweep over SWEEP.SPACE with parallel trials and ASHA pruning.
+
+    Trials run in separate processes sharing the decoded dataset cache, write their
+    checkpoints under CHECKPOINT_NAME/sweep/trial_<k> and their logs next to them. The
+    best trial's adapter and configuration are copied back to the deployment.
+    '''
+    print('Running hyperparameter sweep...')
+    sweep_cfg = config.SWEEP
+    metric = sweep_cfg.METRIC
+    if metric not in METRIC_MODES:
+        raise ValueError(f"Unknown sweep metric: {metric}")
+    mode = METRIC_MODES[metric]
+    sweep_dir = os.path.join(config.CHECKPOINT_NAME, 'sweep')
+    create_directory_if_not_exists(sweep_dir)
+
+    # Decode the dataset once; trials memory-map the same cache files
+    base_config = config.clone()
+    base_config.defrost()
+    base_config.DATASET.CACHE = True
+    base_config.SWEEP.ENABLED = False
+    if config.FINETUNE.INIT_FROM:
+        # Trials checkpoint under <deployment>/sweep, so resolve the warm start source from here
+        base_config.FINETUNE.INIT_PATH = get_warm_start_checkpoint_path(config)
+    base_config.freeze()
+    load_datasets(base_config.clone())
+
+    space = dict(sweep_cfg.SPACE)
+    if config.FINETUNE.INIT_FROM:
+        # A warm start fixes the adapter shape to the one of the checkpoint being continued
+        dropped = [name for name in ('LORA_R', 'LORA_ALPHA') if space.pop(name, None) is not None]
+        if dropped:
+            print(f"[WARNING] Warm starting from {config.FINETUNE.INIT_FROM}, not sweeping {dropped}")
+
+    rng = random.Random(config.SEED)
+    trials = {}
+    for trial_id in range(sweep_cfg.NUM_TRIALS):
+        params = sample_hyperparameters(space, rng)
+        trial_config = base_config.clone()
+        trial_config.defrost()
+        apply_hyperparameters(trial_config, params)
+        trial_config.CHECKPOINT_NAME = os.path.join(sweep_dir, f'trial_{trial_id}')
+        trial_config.MODEL.UUID = f'{config.MODEL.UUID}_trial_{trial_id}'
+        trial_config.freeze()
+        create_directory_if_not_exists(trial_config.CHECKPOINT_NAME)
+        trials[trial_id] = {'config': trial_config, 'trained_config': None, 'params': params,
+                            'best': None, 'epochs': 0, 'status': 'pending'}
+
+    scheduler = SuccessiveHalvingScheduler(
+        sweep_cfg.MIN_EPOCHS, config.EPOCH_NUMBER - config.START_EPOCH, sweep_cfg.REDUCTION_FACTOR, mode)
+    print(f"[SWEEP] {len(trials)} trials, {sweep_cfg.NUM_WORKERS} in parallel, rungs at epochs {scheduler.rungs}")
+    # Trials are ranked (and checkpointed) from the first rung on, never on the untrained model;
+    # capped so that the last reported epoch always counts
+    total_epochs = config.EPOCH_NUMBER - config.START_EPOCH
+    rank_after_epochs = min(scheduler.rungs[0] if scheduler.rungs else 1, max(0, total_epochs - 1))
+
+    num_threads = max(1, (os.cpu_count() or 1) // sweep_cfg.NUM_WORKERS)
+    ctx = mp.get_context('spawn')
+    report_queue = ctx.Queue()
+    pending = list(trials)
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < sweep_cfg.NUM_WORKERS:
+                trial_id = pending.pop(0)
+                trial = trials[trial_id]
+                reply_queue = ctx.Queue()
+                process = ctx.Process(target=_sweep_trial_worker, args=(
+                    trial_id, trial['config'], report_queue, reply_queue,
+                    os.path.join(trial['config'].CHECKPOINT_NAME, 'train.log'), num_threads, rank_after_epochs))
+                process.start()
+                running[trial_id] = (process, reply_queue)
+                trial['status'] = 'running'
+                print(f"[SWEEP] Trial {trial_id} started: {trial['params']}")
+
+            try:
+                message = report_queue.get(timeout=10)
+            except queue.Empty:
+                # A trial killed from outside (e.g. out of memory) never reports back. Only give up on
+                # dead trials once their last messages (sent right before exiting) have been read.
+                for trial_id, (process, _) in list(running.items()):
+                    if not process.is_alive() and report_queue.empty():
+                        running.pop(trial_id)
+                        trials[trial_id]['status'] = 'failed'
+                        print(f"[SWEEP] Trial {trial_id} exited with code {process.exitcode}")
+                continue
+
+            kind, trial_id = message[0], message[1]
+            if trial_id not in running:
+                # Late message from a trial already counted as failed
+                continue
+            trial = trials[trial_id]
+            if kind == 'report':
+                epochs_trained, metrics = message[2], message[3]
+                value = metrics[metric]
+                trial['epochs'] = epochs_trained
+                # A diverged (NaN/inf) value is never a trial's best; train() does not checkpoint it either
+                if epochs_trained >= rank_after_epochs and math.isfinite(value) and (
+                        trial['best'] is None or (value < trial['best'] if mode == 'min' else value > trial['best'])):
+                    trial['best'] = value
+                stop = scheduler.on_report(epochs_trained, value)
+                running[trial_id][1].put(stop)
+                if stop:
+                    trial['status'] = 'pruned'
+                print(f"[SWEEP] Trial {trial_id} | epochs {epochs_trained} | {metric} {value:.4f}" +
+                      (" | pruned" if stop else ""))
+            else:
+                process, _ = running.pop(trial_id)
+                process.join()
+                if kind == 'failed':
+                    trial['status'] = 'failed'
+                    continue
+                trial['trained_config'] = CN.load_cfg(message[2])
+                if trial['status'] == 'running':
+                    trial['status'] = 'completed'
+    finally:
+        # Never leave trials blocked on their reply queue if the sweep stops early
+        for process, _ in running.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    finished = [
+        trial_id for trial_id, trial in trials.items()
+        if trial['best'] is not None and math.isfinite(trial['best'])
+        and os.path.exists(os.path.join(trial['config'].CHECKPOINT_NAME, 'best_model.pth.tr'))
+    ]
+    if not finished:
+        print("[ERROR] No sweep trial reported a result")
+        return
+    best_id = (min if mode == 'min' else max)(finished, key=lambda trial_id: trials[trial_id]['best'])
+    best = trials[best_id]
+
+    for trial_id, trial in trials.items():
+        print(f"[SWEEP] Trial {trial_id} | {trial['status']} | epochs {trial['epochs']} | "
+              f"best {metric} {trial['best']} | {trial['params']}")
+    print(f"[SWEEP] Best trial {best_id}: {metric} {best['best']:.4f} with {best['params']}")
+
+    # Forward the best trial's epoch curves and profile summary so /train/status shows the kept configuration
+    with open(os.path.join(best['config'].CHECKPOINT_NAME, 'train.log')) as log:
+        for line in log:
+            if line.startswith(('pipe:', 'profile:')):
+                print(line, end='')
+
+    # Write the best adapter and configuration back to the deployment
+    create_directory_if_not_exists(config.CHECKPOINT_NAME)
+    shutil.copyfile(os.path.join(best['config'].CHECKPOINT_NAME, 'best_model.pth.tr'),
+                    os.path.join(config.CHECKPOINT_NAME, 'best_model.pth.tr'))
+    best_config = (best['trained_config'] if best['trained_config'] is not None else best['config']).clone()
+    best_config.defrost()
+    best_config.CHECKPOINT_NAME = config.CHECKPOINT_NAME
+    best_config.MODEL.UUID = config.MODEL.UUID
+    with open(os.path.join(config.CHECKPOINT_NAME, 'best_config.yaml'), 'w') as f:
+        f.write(best_config.dump())
+    print(f"[INFO] Best adapter and configuration saved to {config.CHECKPOINT_NAME}")
+    print("sweep:" + json.dumps({
+        'best_trial': best_id,
+        'metric': metric,
+        'value': best['best'],
+        'params': best['params'],
+        'trials': [
+            {'trial': trial_id, 'status': trial['status'], 'epochs': trial['epochs'],
+             'value': trial['best'], 'params': trial['params']}
+            for trial_id, trial in trials.items()
+        ],
+    }))
+
 
 def inference(config):
     print('Running inference...')
@@ -233,8 +550,15 @@ def inference(config):
         config.defrost()
         config.MODEL.NUM_CLASSES = num_classes
         config.freeze()
+
+    if checkpoint.get('lora') is not None:
+        config.defrost()
+        config.LORA.R = checkpoint['lora']['R']
+        config.LORA.ALPHA = checkpoint['lora']['ALPHA']
+        config.freeze()
     
-    dataset_class = load_dataset_instance(config.MODEL_NAME, config.DATASET.DATASET_PATH, inference=True, class_to_idx=class_to_idx)
+    dataset_class = load_dataset_instance(config.MODEL_NAME, config.DATASET.DATASET_PATH, inference=True, class_to_idx=class_to_idx,
+                                          image_size=config.DATASET.IMAGE_SIZE)
 
     inference_loader = DataLoader(
         dataset_class, batch_size=1, shuffle=False,)
@@ -245,7 +569,7 @@ def inference(config):
 
     def image_to_lowres_base64(path_str, max_size=(256, 256)):
         path = Path(path_str)
-        img = Image.open(path)
+        img = open_image(path_str, max(max_size))
         img.thumbnail(max_size)
 
         # Infer format from extension (default to PNG)
@@ -255,7 +579,6 @@ def inference(config):
             '.png': 'PNG',
             '.webp': 'WEBP',
             '.bmp': 'BMP',
-            '.tiff': 'TIFF',
         }
         fmt = ext_to_format.get(path.suffix.lower(), 'PNG')
 
@@ -299,6 +622,8 @@ def main():
     set_random_seed(config.SEED)
     if config.EVAL_ONLY:
         inference(config)
+    elif config.SWEEP.ENABLED:
+        sweep(config)
     else:
         train(config)
 
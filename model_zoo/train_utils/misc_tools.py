@@ -32,8 +32,11 @@ def count_param_numbers(model):
         model_params = model_params + parameter.numel()
     return model_params
 
-def save_checkpoint(model, checkpoint_path, num_classes=None, class_to_idx=None):
-    '''Save only unfrozen (trainable) model weights and other training states'''
+def save_checkpoint(model, checkpoint_path, num_classes=None, class_to_idx=None, train_files=None, lora=None):
+    '''Save only unfrozen (trainable) model weights and other training states
+
+    `train_files` (paths relative to the train split) lets a later warm start tell new files apart,
+    `lora` ({'R', 'ALPHA'}) records the adapter shape the weights were trained with.'''
     
     # Filter only parameters that require gradients
     trainable_state_dict = {
@@ -45,4 +48,6 @@ def save_checkpoint(model, checkpoint_path, num_classes=None, class_to_idx=None)
         'model': trainable_state_dict,
         'num_classes': num_classes,
         'class_to_idx': class_to_idx,
+        'train_files': train_files,
+        'lora': lora,
     }, checkpoint_path)
\ No newline at end of file
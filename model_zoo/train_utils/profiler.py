@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from train_utils.misc_tools import create_directory_if_not_exists
+
+# Phases timed by the training loop, in the order they are reported
+PHASES = ('data_wait', 'h2d', 'augment', 'forward', 'backward', 'optimizer_step', 'validation', 'checkpoint_save')
+
+
+class TrainProfiler:
+    '''Opt-in profiler for the training loop.
+
+    Accumulates wall-clock time per phase, tracks peak host RSS and CUDA memory,
+    and optionally records a torch.profiler trace for steps [trace_start, trace_end]
+    exported as a Chrome trace. When disabled every method is a cheap no-op.
+
+    Args:
+        enabled (bool): whether to collect anything at all
+        device (torch.device): device the model runs on
+        cuda_sync (bool): synchronize CUDA around each phase so GPU work is attributed correctly
+        trace_start (int): first global train step of the torch.profiler window (-1 => no trace)
+        trace_end (int): last global train step of the torch.profiler window
+        trace_dir (str): directory the Chrome trace is written to
+    '''
+    def __init__(self, enabled=False, device=None, cuda_sync=True, trace_start=-1, trace_end=-1, trace_dir=None):
+        self.enabled = enabled
+        self.device = device if device is not None else torch.device('cpu')
+        self.use_cuda = self.device.type == 'cuda'
+        self.cuda_sync = cuda_sync and self.use_cuda
+        self.trace_start = trace_start
+        self.trace_end = trace_end
+        self.trace_dir = trace_dir
+        self.trace_path = None
+
+        self.totals = {phase: 0.0 for phase in PHASES}
+        self.counts = {phase: 0 for phase in PHASES}
+        self.step = 0
+        self.epochs = 0
+        self._start_time = None
+        self._torch_profiler = None
+
+        if self.enabled and self.use_cuda:
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+    def _sync(self):
+        if self.cuda_sync:
+            torch.cuda.synchronize(self.device)
+
+    def start(self):
+        '''Marks the beginning of the job'''
+        if self.enabled:
+            self._start_time = time.perf_counter()
+
+    @contextmanager
+    def _timed(self, name):
+        self._sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def phase(self, name):
+        '''Returns a context manager timing the enclosed block under `name`'''
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    def timed_iter(self, loader):
+        '''Wraps a DataLoader so the time spent waiting for each batch is recorded as `data_wait`'''
+        if not self.enabled:
+            yield from loader
+            return
+        iterator = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.totals['data_wait'] += time.perf_counter() - start
+            self.counts['data_wait'] += 1
+            yield batch
+
+    def _trace_requested(self):
+        return self.trace_start >= 0 and self.trace_end >= self.trace_start
+
+    def step_begin(self):
+        '''Called at the start of every train step; opens the torch.profiler window when reached'''
+        if not self.enabled or not self._trace_requested():
+            return
+        if self.step == self.trace_start and self._torch_profiler is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.use_cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(
+                activities=activities, record_shapes=True, profile_memory=True)
+            self._torch_profiler.__enter__()
+            print(f'[PROFILE] torch.profiler trace started at step {self.step}')
+
+    def step_end(self):
+        '''Called at the end of every train step; closes and exports the trace window when done'''
+        if not self.enabled:
+            return
+        if self._torch_profiler is not None and self.step >= self.trace_end:
+            self._stop_trace()
+        self.step += 1
+
+    def _stop_trace(self):
+        self._torch_profiler.__exit__(None, None, None)
+        create_directory_if_not_exists(self.trace_dir)
+        self.trace_path = os.path.join(
+            self.trace_dir, f'trace_steps_{self.trace_start}_{self.trace_end}.json')
+        self._torch_profiler.export_chrome_trace(self.trace_path)
+        self._torch_profiler = None
+        print(f'[PROFILE] Chrome trace saved: {self.trace_path}')
+
+    def epoch_end(self):
+        if self.enabled:
+            self.epochs += 1
+
+    def peak_rss_mb(self):
+        '''Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)'''
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return peak / (1024 ** 2)
+        return peak / 1024
+
+    def peak_cuda_mb(self):
+        if not self.use_cuda:
+            return None
+        return torch.cuda.max_memory_allocated(self.device) / (1024 ** 2)
+
+    def summary(self):
+        '''Returns the collected statistics as a flat, JSON-serializable dict'''
+        if self._torch_profiler is not None:
+            # The job ended inside the trace window; keep what was recorded
+            self._stop_trace()
+        total_time = time.perf_counter() - self._start_time if self._start_time is not None else 0.0
+        summary = {
+            'total_s': total_time,
+            'steps': self.step,
+            'epochs': self.epochs,
+            'peak_rss_mb': self.peak_rss_mb(),
+        }
+        peak_cuda = self.peak_cuda_mb()
+        if peak_cuda is not None:
+            summary['peak_cuda_mb'] = peak_cuda
+        for phase in PHASES:
+            summary[f'{phase}_s'] = self.totals[phase]
+            if self.counts[phase] > 0:
+                summary[f'{phase}_avg_ms'] = 1000 * self.totals[phase] / self.counts[phase]
+        if self.trace_path is not None:
+            summary['trace_path'] = self.trace_path
+        return summary
+
+    def report(self):
+        '''Prints a human-readable summary and the `profile:` line parsed by the backend'''
+        if not self.enabled:
+            return
+        summary = self.summary()
+        print('[PROFILE] Summary:')
+        for phase in PHASES:
+            share = 100 * summary[f'{phase}_s'] / summary['total_s'] if summary['total_s'] > 0 else 0.0
+            print(f'[PROFILE] {phase:<16} {summary[f"{phase}_s"]:10.3f}s ({share:5.1f}%)')
+        print(f'[PROFILE] peak RSS: {summary["peak_rss_mb"]:.1f} MB')
+        if 'peak_cuda_mb' in summary:
+            print(f'[PROFILE] peak CUDA memory: {summary["peak_cuda_mb"]:.1f} MB')
+        print('profile:' + json.dumps(summary))
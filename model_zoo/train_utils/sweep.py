@@ -0,0 +1,88 @@
+import math
+import numpy as np
+
+# Search space entries of the SWEEP.SPACE config: name -> (config key path, sampling)
+#   'log'     => [low, high] sampled log-uniformly
+#   'uniform' => [low, high] sampled uniformly
+#   'choice'  => list of candidate values
+SEARCH_SPACE = {
+    'LR_BASE': (('LR', 'BASE'), 'log'),
+    'LR_LORA': (('LR', 'LORA'), 'log'),
+    'WEIGHT_DECAY': (('WEIGHT_DECAY',), 'uniform'),
+    'LORA_R': (('LORA', 'R'), 'choice'),
+    'LORA_ALPHA': (('LORA', 'ALPHA'), 'choice'),
+}
+
+# Whether a larger value of the monitored metric is better
+METRIC_MODES = {
+    'val_loss': 'min',
+    'val_acc': 'max',
+}
+
+
+def sample_hyperparameters(space, rng):
+    '''Draws one value per entry of the SWEEP.SPACE config node
+
+    Args:
+        space (CfgNode): SWEEP.SPACE, keys from SEARCH_SPACE
+        rng (random.Random): random generator of the sweep
+    '''
+    params = {}
+    for name, values in space.items():
+        if name not in SEARCH_SPACE:
+            raise ValueError(f"Unknown sweep parameter: {name}")
+        _, sampling = SEARCH_SPACE[name]
+        if sampling == 'choice':
+            params[name] = rng.choice(list(values))
+        elif sampling == 'log':
+            params[name] = math.exp(rng.uniform(math.log(values[0]), math.log(values[1])))
+        else:
+            params[name] = rng.uniform(values[0], values[1])
+    return params
+
+
+def apply_hyperparameters(config, params):
+    '''Writes sampled hyperparameters into a (defrosted) config'''
+    for name, value in params.items():
+        keys, _ = SEARCH_SPACE[name]
+        node = config
+        for key in keys[:-1]:
+            node = node[key]
+        node[keys[-1]] = value
+
+
+class SuccessiveHalvingScheduler:
+    '''Asynchronous successive halving (ASHA) on epoch-level validation metrics.
+
+    Rungs sit at MIN_EPOCHS * REDUCTION_FACTOR^k epochs. When a trial reaches a rung it
+    is compared to every result recorded at that rung so far and keeps running only if it
+    is within the best 1 / REDUCTION_FACTOR of them; trials never wait for each other.
+
+    Args:
+        min_epochs (int): epochs every trial runs before its first evaluation
+        max_epochs (int): epoch budget of a trial that is never pruned
+        reduction_factor (int): fraction of trials kept at every rung is 1 / reduction_factor
+        mode (str): 'min' or 'max', whether lower or higher metric values are better
+    '''
+    def __init__(self, min_epochs, max_epochs, reduction_factor=3, mode='min'):
+        self.reduction_factor = reduction_factor
+        self.mode = mode
+        self.rungs = []
+        rung = max(1, min_epochs)
+        while rung < max_epochs:
+            self.rungs.append(rung)
+            rung *= reduction_factor
+        self.recorded = {rung: [] for rung in self.rungs}
+
+    def on_report(self, epochs_trained, value):
+        '''Records a result and returns True when the trial should be stopped'''
+        if not math.isfinite(value):
+            return True
+        if epochs_trained not in self.recorded:
+            return False
+        recorded = self.recorded[epochs_trained]
+        recorded.append(value)
+        keep = 100 / self.reduction_factor
+        if self.mode == 'min':
+            return value > np.percentile(recorded, keep)
+        return value < np.percentile(recorded, 100 - keep)
@@ -0,0 +1,95 @@
+import os
+import random
+import torch
+
+
+def get_warm_start_checkpoint_path(config):
+    '''Returns the checkpoint of the deployment named by FINETUNE.INIT_FROM
+
+    Deployments share the parent directory of CHECKPOINT_NAME (checkpoints/lora_weights/<id>).
+    INIT_FROM comes from the API, so the resolved path must stay inside that directory.
+    A path already resolved by the caller (FINETUNE.INIT_PATH, set for sweep trials whose
+    CHECKPOINT_NAME lives elsewhere) is used as is.
+    '''
+    if config.FINETUNE.INIT_PATH:
+        return config.FINETUNE.INIT_PATH
+    lora_weights_dir = os.path.realpath(os.path.dirname(os.path.normpath(config.CHECKPOINT_NAME)))
+    checkpoint_path = os.path.realpath(
+        os.path.join(lora_weights_dir, config.FINETUNE.INIT_FROM, 'best_model.pth.tr'))
+    if os.path.commonpath([lora_weights_dir, checkpoint_path]) != lora_weights_dir:
+        raise ValueError(f"Invalid warm start deployment: {config.FINETUNE.INIT_FROM}")
+    return checkpoint_path
+
+
+def load_warm_start_checkpoint(config):
+    '''Loads the adapter/head checkpoint to warm start from, or raises if it is missing'''
+    checkpoint_path = get_warm_start_checkpoint_path(config)
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"Warm start checkpoint not found: {checkpoint_path}")
+    print(f"[INFO] Warm starting from {checkpoint_path}")
+    return torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+
+
+def extend_class_to_idx(class_to_idx, class_names):
+    '''Keeps the indices of known classes and appends unseen ones after them
+
+    Args:
+        class_to_idx (dict): mapping stored in the warm start checkpoint
+        class_names (list): class folder names found in the new dataset
+    '''
+    extended = dict(class_to_idx)
+    for class_name in sorted(class_names):
+        if class_name not in extended:
+            extended[class_name] = len(extended)
+    return extended
+
+
+def load_warm_start_weights(model, state_dict):
+    '''Copies checkpointed trainable weights into `model`.
+
+    Tensors whose first dimension grew (the head's last nn.Linear when classes were added)
+    receive the old rows; the rows of the new classes keep their fresh initialization.
+    '''
+    model_state = model.state_dict()
+    extended = []
+    for name, tensor in state_dict.items():
+        if name not in model_state:
+            print(f"[WARNING] Warm start weight {name} does not exist in the model, skipping")
+            continue
+        target = model_state[name]
+        if target.shape == tensor.shape:
+            target.copy_(tensor)
+        elif target.shape[1:] == tensor.shape[1:] and target.shape[0] > tensor.shape[0]:
+            target[:tensor.shape[0]].copy_(tensor)
+            extended.append(name)
+        else:
+            raise ValueError(
+                f"Cannot warm start {name}: checkpoint shape {tuple(tensor.shape)} vs model shape {tuple(target.shape)}")
+    if extended:
+        print(f"[INFO] Extended for new classes: {extended}")
+
+
+def select_incremental_indices(train_files, seen_files, replay_ratio, seed=0):
+    '''Selects every sample not seen by the warm start run plus a replay sample of old ones
+
+    Args:
+        train_files (list): sample paths of the dataset, relative to the train split
+        seen_files (list): relative paths trained on by the warm start run
+        replay_ratio (float): number of old samples replayed per new sample
+        seed (int): seed for the replay draw
+    '''
+    seen_files = set(seen_files)
+    new_indices, old_indices = [], []
+    for i, path in enumerate(train_files):
+        if path in seen_files:
+            old_indices.append(i)
+        else:
+            new_indices.append(i)
+    if not new_indices:
+        print("[INFO] No new samples since the warm start run, training on the full dataset")
+        return list(range(len(train_files)))
+
+    n_replay = min(len(old_indices), int(round(replay_ratio * len(new_indices))))
+    replay_indices = random.Random(seed).sample(old_indices, n_replay)
+    print(f"[INFO] Incremental training on {len(new_indices)} new and {n_replay} replayed samples")
+    return sorted(new_indices + replay_indices)